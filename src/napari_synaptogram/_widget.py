@@ -1,11 +1,364 @@
+import functools
+import importlib
+
 import napari
 import numpy as np
 import scipy as sp
-from magicgui.widgets import CheckBox, Container, PushButton, create_widget
+from magicgui.widgets import (
+    CheckBox,
+    ComboBox,
+    Container,
+    PushButton,
+    create_widget,
+)
 from napari.layers import Image, Points
+from napari.qt.threading import thread_worker
 from skimage.draw import polygon2mask
-from skimage.feature import blob_log
-from skimage.util import img_as_float
+from skimage.feature import blob_dog
+from skimage.util import img_as_float32
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+@functools.cache
+def _gpu_available():
+    """
+    Check whether blob detection can be offloaded to a CUDA device via cuCIM
+    """
+    try:
+        import cucim.skimage.feature  # noqa: F401
+        import cupy
+
+        return cupy.cuda.runtime.getDeviceCount() > 0
+    except (ImportError, RuntimeError):
+        # RuntimeError covers CUDA runtime failures (e.g., no driver).
+        return False
+
+
+def _accelerated(func, gpu_module, image, *args, **kwargs):
+    """
+    Call `func` on `image`, using the equivalent GPU implementation when
+    available
+
+    The GPU implementation is the function of the same name in `gpu_module`.
+    Both the input and result are NumPy arrays. Falls back to `func` if the
+    volume does not fit in GPU memory.
+    """
+    if not _gpu_available():
+        return func(image, *args, **kwargs)
+
+    import cupy
+
+    gpu_func = getattr(importlib.import_module(gpu_module), func.__name__)
+    try:
+        return cupy.asnumpy(gpu_func(cupy.asarray(image), *args, **kwargs))
+    except cupy.cuda.memory.OutOfMemoryError:
+        # Release whatever was allocated before the failure so it is
+        # available to later calls.
+        cupy.get_default_memory_pool().free_all_blocks()
+        return func(image, *args, **kwargs)
+
+
+def _fft_gaussian_laplace(image, sigma):
+    """
+    Compute the Laplacian of Gaussian of `image` in the frequency domain
+
+    The image is padded by reflection before the transform so that the result
+    matches `scipy.ndimage.gaussian_laplace` (which defaults to reflecting at
+    the edges) rather than wrapping around.
+    """
+    # Match the kernel radius used by scipy.ndimage (truncate=4.0). Pad out to
+    # a size that the FFT handles efficiently.
+    radius = int(4 * sigma + 0.5)
+    pad = []
+    for n in image.shape:
+        size = sp.fft.next_fast_len(n + 2 * radius, real=True)
+        pad.append((radius, size - n - radius))
+    padded = np.pad(image, pad, mode="symmetric")
+
+    # Squared spatial frequency at each point in the (real) FFT.
+    k2 = np.zeros((1,) * image.ndim, dtype=np.float32)
+    for axis, n in enumerate(padded.shape):
+        # The last axis only holds the non-negative frequencies.
+        last = axis == image.ndim - 1
+        k = sp.fft.rfftfreq(n) if last else sp.fft.fftfreq(n)
+        shape = [1] * image.ndim
+        shape[axis] = -1
+        k2 = k2 + k.astype(np.float32).reshape(shape) ** 2
+
+    # Frequency response of the Gaussian multiplied by that of the Laplacian.
+    response = -4 * np.pi**2 * k2 * np.exp(-2 * np.pi**2 * sigma**2 * k2)
+    transform = sp.fft.rfftn(padded, workers=-1)
+    transform *= response
+    log = sp.fft.irfftn(transform, s=padded.shape, workers=-1)
+    crop = tuple(
+        slice(r, r + n) for (r, _), n in zip(pad, image.shape, strict=True)
+    )
+    return log[crop].astype(image.dtype, copy=False)
+
+
+def _gaussian_laplace(image, sigma, use_fft=False):
+    """
+    Compute the Laplacian of Gaussian of `image`
+
+    Uses the GPU when available. If `use_fft` is True, the image is instead
+    filtered in the frequency domain on the CPU, which is faster than the
+    separable spatial filters for large volumes with wide kernels. The FFT
+    applies the Gaussian without truncating it, so the response differs
+    slightly (typically around 1% of the peak) from spatial filtering and
+    detected points near the threshold may change.
+    """
+    if use_fft:
+        return _fft_gaussian_laplace(image, sigma)
+    return _accelerated(
+        sp.ndimage.gaussian_laplace, "cupyx.scipy.ndimage", image, sigma
+    )
+
+
+def _log_peaks(image, sigma, use_fft=False):
+    """
+    Find local maxima of a single-scale Laplacian of Gaussian
+
+    Returns the coordinates and response of every positive local maximum.
+    Since thresholds are non-negative, blobs for any threshold can then be
+    selected from these without refiltering the image. See
+    `_gaussian_laplace` for `use_fft`.
+    """
+    log = _gaussian_laplace(image, sigma, use_fft)
+    # Invert and scale-normalize the response so the threshold has the same
+    # meaning as in `blob_log`.
+    log *= -(sigma**2)
+    # A voxel is a peak if it is the maximum of its 3x3x3 neighborhood. This
+    # is what `peak_local_max` does, but without the overhead of sorting the
+    # peaks and enforcing a minimum spacing between them.
+    peaks = sp.ndimage.maximum_filter(log, size=3, mode="nearest") == log
+    peaks &= log > 0
+    return np.argwhere(peaks), log[peaks]
+
+
+# Ratio between successive scales used for DoG detection.
+DOG_SIGMA_RATIO = 1.6
+
+
+def _dog_blobs(image, threshold, sigma):
+    """
+    Detect blobs using the Difference of Gaussians approximation to LoG
+    """
+    blobs = _accelerated(
+        blob_dog,
+        "cucim.skimage.feature",
+        image,
+        threshold=threshold,
+        min_sigma=sigma,
+        max_sigma=2 * sigma,
+        sigma_ratio=DOG_SIGMA_RATIO,
+    )
+    return blobs[:, :3]
+
+
+def _dog_sigmas(sigma):
+    """
+    Return the scales `blob_dog` filters at when called by `_dog_blobs`
+    """
+    k = int(np.log(2) / np.log(DOG_SIGMA_RATIO) + 1)
+    return sigma * DOG_SIGMA_RATIO ** np.arange(k + 1)
+
+
+def _log_halo(sigma):
+    """
+    Return the margin (in voxels) needed around a crop so that LoG detection
+    within the crop matches detection on the full volume
+    """
+    # Kernels are truncated at 4 standard deviations (the default in both
+    # scipy and scikit-image). Peaks are compared with their neighbors.
+    return int(4 * sigma + 0.5) + 1
+
+
+def _dog_halo(sigma):
+    """
+    Return the margin (in voxels) needed around a crop so that DoG detection
+    within the crop matches detection on the full volume
+    """
+    max_sigma = _dog_sigmas(sigma).max()
+    # In addition to the filtering, `blob_dog` discards blobs that overlap a
+    # larger blob. Blobs have a radius of sqrt(3) * sigma in 3D, so include
+    # any neighbors that may overlap a blob at the edge of the region.
+    overlap = int(np.ceil(2 * np.sqrt(3) * max_sigma))
+    return _log_halo(max_sigma) + overlap
+
+
+# Blob detectors available in the widget, mapped to the function giving the
+# margin each one needs around a crop. LoG is more accurate, whereas DoG
+# approximates LoG with fewer Gaussian convolutions and is therefore faster.
+BLOB_DETECTORS = {
+    "LoG": _log_halo,
+    "DoG": _dog_halo,
+}
+
+
+# Number of fractional bits used when passing polygon vertices to OpenCV.
+CV2_SHIFT = 8
+
+
+def _fill_polygon(mask, vertices, use_cv2=False):
+    """
+    Set pixels inside the 2D polygon to True in `mask`
+
+    Only the bounding box of the polygon is rasterized, which is much cheaper
+    than rasterizing the full plane when the polygon is small.
+
+    By default, pixels are selected using `polygon2mask` (i.e., pixels whose
+    centers fall inside the polygon). If `use_cv2` is True, OpenCV is used
+    instead. This is considerably faster but does not follow the same rule:
+    it also fills pixels that the polygon outline passes through and can
+    drop some pixels near the outline, so the mask may be several percent
+    larger for irregular ROIs. The resulting masked volumes (and hence
+    detected points) will differ slightly between the two.
+    """
+    lb = np.maximum(np.floor(vertices.min(axis=0)).astype(int), 0)
+    ub = np.minimum(np.ceil(vertices.max(axis=0)).astype(int) + 1, mask.shape)
+    if np.any(ub <= lb):
+        # Polygon falls entirely outside of the mask.
+        return
+    bbox = tuple(slice(lo, hi) for lo, hi in zip(lb, ub, strict=True))
+    if not use_cv2:
+        mask[bbox] |= polygon2mask(ub - lb, vertices - lb)
+        return
+
+    # OpenCV expects integer (x, y) vertices (i.e., column, row) with the
+    # fractional part encoded in the lower bits.
+    fill = np.zeros(ub - lb, dtype=np.uint8)
+    points = (vertices - lb)[:, ::-1] * 2**CV2_SHIFT
+    cv2.fillPoly(fill, [np.round(points).astype(np.int32)], 1, shift=CV2_SHIFT)
+    mask[bbox] |= fill.view(bool)
+
+
+def _roi_mask(polygons, shape, use_cv2=False):
+    """
+    Build a boolean mask from ROI polygons that broadcasts against a volume
+
+    Polygons drawn in the same plane are combined into a single mask (i.e.,
+    the union of the polygons). Masks from different planes are extruded
+    along the remaining axis and intersected. See `_fill_polygon` for
+    `use_cv2`.
+    """
+    plane_masks = {}
+    for polygon in polygons:
+        # Polygons are drawn in 2D space. Determine axes of the space.
+        axes = tuple(np.flatnonzero(np.ptp(polygon, axis=0)))
+        if axes not in plane_masks:
+            plane_shape = np.take(shape, axes)
+            plane_masks[axes] = np.zeros(plane_shape, dtype=bool)
+        _fill_polygon(plane_masks[axes], polygon[:, axes], use_cv2)
+
+    mask = np.ones((1,) * len(shape), dtype=bool)
+    for axes, plane_mask in plane_masks.items():
+        broadcast = tuple(
+            slice(None) if i in axes else np.newaxis for i in range(len(shape))
+        )
+        mask = mask & plane_mask[broadcast]
+    return mask
+
+
+def _ray_argmax_scipy(volume, start, stop, n):
+    """
+    Find the point of maximum intensity along a ray through a volume
+
+    The volume is sampled at `n` evenly-spaced points from `start` to `stop`
+    (inclusive) using trilinear interpolation. Samples outside the volume are
+    treated as zero.
+    """
+    ray = np.linspace(start, stop, n, endpoint=True)
+    intensities = sp.ndimage.map_coordinates(
+        volume, ray.T, order=1, mode="constant", cval=0
+    )
+    return ray[intensities.argmax()]
+
+
+if numba is not None:
+
+    @numba.njit(cache=True)
+    def _ray_argmax_numba(volume, start, stop, n):
+        """
+        Numba implementation of `_ray_argmax_scipy`
+        """
+        step = (stop - start) / max(n - 1, 1)
+        best_point = start.copy()
+        best_value = -np.inf
+        for i in range(n):
+            point = start + i * step
+            value = 0.0
+            # Match map_coordinates(mode="constant"), which does not
+            # interpolate beyond the edges of the volume.
+            inside = True
+            for axis in range(3):
+                if point[axis] < 0 or point[axis] > volume.shape[axis] - 1:
+                    inside = False
+            if inside:
+                lower = np.floor(point)
+                frac = point - lower
+                z0, y0, x0 = int(lower[0]), int(lower[1]), int(lower[2])
+                for dz in range(2):
+                    if z0 + dz >= volume.shape[0]:
+                        continue
+                    wz = frac[0] if dz else 1 - frac[0]
+                    for dy in range(2):
+                        if y0 + dy >= volume.shape[1]:
+                            continue
+                        wy = frac[1] if dy else 1 - frac[1]
+                        for dx in range(2):
+                            if x0 + dx >= volume.shape[2]:
+                                continue
+                            wx = frac[2] if dx else 1 - frac[2]
+                            v = volume[z0 + dz, y0 + dy, x0 + dx]
+                            value += wz * wy * wx * v
+            if value > best_value:
+                best_value = value
+                best_point = point
+        return best_point
+
+    _ray_argmax = _ray_argmax_numba
+else:
+    _ray_argmax = _ray_argmax_scipy
+
+
+# Maximum number of voxels sampled when estimating contrast limits.
+CONTRAST_SAMPLE_SIZE = 1_000_000
+
+
+def _contrast_limits(data, percentiles=(0, 99.99)):
+    """
+    Estimate contrast limits from percentiles of the data
+
+    Large volumes are randomly subsampled since sorting every voxel is slow
+    and the percentiles of the sample are close enough for display purposes.
+    """
+    flat = np.ravel(data)
+    if flat.size > CONTRAST_SAMPLE_SIZE:
+        # Use a fixed seed so that repeated calls give the same result. A
+        # random (rather than strided) sample avoids aliasing with the image
+        # dimensions.
+        rng = np.random.default_rng(0)
+        flat = flat[rng.integers(0, flat.size, CONTRAST_SAMPLE_SIZE)]
+    return np.percentile(flat, percentiles)
+
+
+@thread_worker
+def _iter_contrast_limits(layers):
+    for layer in layers:
+        yield layer, _contrast_limits(layer.data)
+
+
+# Maximum number of image layers to keep float conversions for.
+FLOAT_CACHE_SIZE = 2
 
 
 class CtBP2Detection(Container):
@@ -19,9 +372,19 @@ class CtBP2Detection(Container):
         self._roi_layer_combo = create_widget(
             label="ROI", annotation="napari.layers.Shapes"
         )
+        self._method_combo = ComboBox(
+            label="Method", choices=list(BLOB_DETECTORS), value="LoG"
+        )
+        self._sigma_spinbox = create_widget(
+            label="Sigma", annotation=float, widget_type="FloatSpinBox"
+        )
         self._threshold_slider = create_widget(
             label="Threshold", annotation=float, widget_type="FloatSlider"
         )
+        # Filtering in the frequency domain is faster for large volumes but
+        # gives a slightly different response, so it must be chosen
+        # explicitly.
+        self._fft_checkbox = CheckBox(text="Fast LoG (FFT)", value=False)
 
         self._xy_button = PushButton(text="XY")
         self._xz_button = PushButton(text="XZ")
@@ -45,20 +408,38 @@ class CtBP2Detection(Container):
 
         self._mask_button = PushButton(text="Mask")
         self._mask_button.clicked.connect(self._mask)
+        # Rasterizing ROIs with OpenCV is faster but selects slightly
+        # different pixels than scikit-image, so it must be chosen explicitly.
+        self._opencv_checkbox = CheckBox(
+            text="Fast ROI (OpenCV)", value=False, enabled=cv2 is not None
+        )
+        self._opencv_checkbox.changed.connect(self._clear_roi_masks)
         row = [
             self._image_layer_combo,
             self._roi_layer_combo,
+            self._opencv_checkbox,
             self._mask_button,
         ]
         self._image_container = Container(widgets=row, layout="vertical")
 
         self._run_button = PushButton(text="Run")
         self._run_button.clicked.connect(self._detect_points)
+        self._sigma_spinbox.min = 0.5
+        self._sigma_spinbox.max = 10
+        self._sigma_spinbox.step = 0.1
+        self._sigma_spinbox.value = 1
         self._threshold_slider.min = 0
         self._threshold_slider.max = 1
         self._threshold_slider.value = 0.1
+        self._threshold_slider.changed.connect(self._threshold_changed)
 
-        row = [self._threshold_slider, self._run_button]
+        row = [
+            self._method_combo,
+            self._sigma_spinbox,
+            self._threshold_slider,
+            self._fft_checkbox,
+            self._run_button,
+        ]
         self._process_container = Container(widgets=row, layout="horizontal")
 
         # append into/extend the container with your widgets
@@ -75,12 +456,51 @@ class CtBP2Detection(Container):
         self._viewer.layers.events.removed.connect(
             self._rescan_layers, position="last"
         )
+        self._viewer.layers.events.removed.connect(self._on_layer_removed)
         self._handling_points = False
 
+        # Compile the ray search for the data types we have up front so that
+        # the first click on a points layer does not stall.
+        for layer in self._viewer.layers:
+            if isinstance(layer, Image) and layer.ndim == 3:
+                volume = np.zeros((1, 1, 1), dtype=layer.dtype)
+                _ray_argmax(volume, np.zeros(3), np.zeros(3), 2)
+
+        # Float conversions of image layers, keyed by layer. Each entry is a
+        # tuple of (source data, converted data) so we can detect when the
+        # data on the layer has been replaced.
+        self._float_images = {}
+
+        # Buffers holding the masked data, keyed by source layer.
+        self._mask_buffers = {}
+
+        # ROI masks, keyed by (ROI layer, volume shape). All image channels
+        # typically share a shape, so the polygons only need to be rasterized
+        # once. Cleared whenever the ROIs are edited.
+        self._roi_masks = {}
+        # ROI layers whose data events clear the cached masks.
+        self._watched_roi_layers = set()
+
+        # Candidate peaks from the most recent LoG detection as a tuple of
+        # (key, float image, peaks), where the key is a tuple of (image layer,
+        # crop, sigma, use FFT) so that changes to the threshold only need
+        # to select from the candidates.
+        self._log_cache = None
+
+        # Result of the most recent detection as a tuple of (image layer,
+        # points layer, points). Used to check whether the points have been
+        # edited by hand since.
+        self._last_detection = None
+
     def _rescan_layers(self):
         self._roi_map = {}
         for layer in self._viewer.layers:
-            if isinstance(layer, Points):
+            # Layers are rescanned every time one is added or removed, so
+            # make sure the callback is only registered once per layer.
+            if (
+                isinstance(layer, Points)
+                and self._mouse_click not in layer.mouse_drag_callbacks
+            ):
                 layer.mouse_drag_callbacks.append(self._mouse_click)
             if isinstance(layer, Image) and "masked" not in layer.name:
                 self._roi_map[layer] = None
@@ -101,18 +521,164 @@ class CtBP2Detection(Container):
             #        self._image_layer_combo.value = self._roi_map[src_layer]
         self._update_projection()
 
+    def _on_layer_removed(self, event):
+        if self._mouse_click in event.value.mouse_drag_callbacks:
+            event.value.mouse_drag_callbacks.remove(self._mouse_click)
+        self._float_images.pop(event.value, None)
+        self._discard_log_cache(event.value)
+        if self._last_detection is not None and any(
+            layer is event.value for layer in self._last_detection[:2]
+        ):
+            self._last_detection = None
+        self._mask_buffers.pop(event.value, None)
+        for key in list(self._roi_masks):
+            if key[0] is event.value:
+                del self._roi_masks[key]
+        if event.value in self._watched_roi_layers:
+            event.value.events.data.disconnect(self._clear_roi_masks)
+            self._watched_roi_layers.remove(event.value)
+
+    def _get_roi_mask(self, roi_layer, shape):
+        key = roi_layer, shape
+        if key not in self._roi_masks:
+            use_cv2 = self._opencv_checkbox.value
+            self._roi_masks[key] = _roi_mask(roi_layer.data, shape, use_cv2)
+        if roi_layer not in self._watched_roi_layers:
+            roi_layer.events.data.connect(self._clear_roi_masks)
+            self._watched_roi_layers.add(roi_layer)
+        return self._roi_masks[key]
+
+    def _search_region(self, shape, halo):
+        """
+        Return the region of the volume to search for blobs
+
+        The region is returned as a tuple of (crop, lb, ub). `crop` is the
+        slices to extract from the volume for filtering, which includes a
+        margin of `halo` voxels so that filtering near the edges of the region
+        is not affected by the crop. `lb` and `ub` are the bounds within which
+        detected points are kept. Returns None if the ROIs fall outside of the
+        volume.
+        """
+        bounds = self._roi_bounds(shape)
+        if bounds is None:
+            bounds = [(0, n) for n in shape]
+        elif len(bounds) == 0:
+            return None
+        lb, ub = np.array(bounds).T
+        start = np.maximum(lb - halo, 0)
+        crop = tuple(
+            slice(s, e + halo) for s, e in zip(start, ub, strict=True)
+        )
+        return crop, lb, ub
+
+    def _cached_log_peaks(self, image_layer, image, crop, sigma):
+        """
+        Return candidate LoG peaks in the cropped image, reusing the previous
+        result if the image, crop and filter settings have not changed
+        """
+        use_fft = self._fft_checkbox.value
+        key = image_layer, crop, sigma, use_fft
+        cache = self._log_cache
+        if cache is None or cache[0] != key or cache[1] is not image:
+            peaks = _log_peaks(image[crop], sigma, use_fft)
+            self._log_cache = key, image, peaks
+        return self._log_cache[2]
+
+    def _discard_log_cache(self, layer):
+        if self._log_cache is not None and self._log_cache[0][0] is layer:
+            self._log_cache = None
+
+    def _threshold_changed(self):
+        # Once LoG detection has been run, the points can be updated as the
+        # threshold changes since the image does not need to be refiltered.
+        # Only do so while the points layer still holds the last detection so
+        # that points added or removed by hand are not lost. Otherwise, the
+        # new threshold is applied the next time detection is run.
+        if self._method_combo.value != "LoG" or self._log_cache is None:
+            return
+        if self._last_detection is None:
+            return
+        image_layer, _, sigma, use_fft = self._log_cache[0]
+        if (
+            image_layer is not self._image_layer_combo.value
+            or sigma != self._sigma_spinbox.value
+            or use_fft != self._fft_checkbox.value
+        ):
+            return
+        detected_layer, points_layer, points = self._last_detection
+        if (
+            detected_layer is not image_layer
+            or points_layer not in self._viewer.layers
+            or not np.array_equal(points_layer.data, points)
+        ):
+            return
+        self._update_points(image_layer, self._find_points(image_layer))
+
+    def _roi_bounds(self, shape):
+        """
+        Return the (start, stop) bounds of the selected ROIs along each axis
+
+        Returns None if there are no ROIs to restrict the search to and an
+        empty list if the ROIs fall outside of the volume.
+        """
+        roi_layer = self._roi_layer_combo.value
+        if roi_layer is None or len(roi_layer.data) == 0:
+            return None
+        mask = self._get_roi_mask(roi_layer, shape)
+        if not mask.any():
+            return []
+        bounds = []
+        for axis, n in enumerate(shape):
+            if mask.shape[axis] == 1:
+                # Mask is extruded along this axis.
+                bounds.append((0, n))
+            else:
+                other = tuple(i for i in range(mask.ndim) if i != axis)
+                indices = np.flatnonzero(mask.any(axis=other))
+                bounds.append((indices[0], indices[-1] + 1))
+        return bounds
+
+    def _clear_roi_masks(self):
+        self._roi_masks.clear()
+
+    def _float_image(self, layer):
+        """
+        Return layer data converted to float32, reusing the previous
+        conversion if the data has not changed (e.g., when only the threshold
+        is tweaked)
+        """
+        data, image = self._float_images.pop(layer, (None, None))
+        if data is not layer.data:
+            image = img_as_float32(layer.data)
+        self._float_images[layer] = layer.data, image
+        # Only hold on to the most recently used conversions since each one is
+        # a full copy of the volume.
+        while len(self._float_images) > FLOAT_CACHE_SIZE:
+            del self._float_images[next(iter(self._float_images))]
+        return image
+
     def _auto_contrast(self):
+        layers = []
         for layer in self._viewer.layers:
             if isinstance(layer, Image):
                 layer.projection_mode = "max"
-                layer.contrast_limits = np.percentile(layer.data, [0, 99.99])
+                layers.append(layer)
+        # Percentiles are computed in a background thread so the UI stays
+        # responsive. The limits are set on the main thread as they arrive.
+        worker = _iter_contrast_limits(layers)
+        worker.yielded.connect(self._set_contrast_limits)
+        worker.start()
+
+    def _set_contrast_limits(self, result):
+        layer, contrast_limits = result
+        layer.contrast_limits = contrast_limits
 
     def _mask(self):
         roi_layer = self._roi_layer_combo.value
         if roi_layer is None:
             return
 
-        for layer in self._viewer.layers[:]:
+        for layer in list(self._viewer.layers):
             if not isinstance(layer, napari.layers.Image):
                 continue
             if layer not in self._roi_map:
@@ -139,32 +705,46 @@ class CtBP2Detection(Container):
                 if layer.name.lower().endswith("ctbp2"):
                     self._image_layer_combo.value = masked_layer
 
-            # Make a copy of the master layer to operate on. Then, iterate
-            # through all shapes, apply the mask, then set the modified data on
-            # the masked layer.
-            layer_data = layer.data.copy()
-
-            for polygon in roi_layer.data:
-                # Polygons are drawn in 2D space. Determine axes of the space.
-                axes = np.flatnonzero(polygon.std(axis=0))
-                shape = np.take(masked_layer.data.shape, axes)
-                vertices = polygon[:, axes]
-                broadcast = tuple(
-                    slice(None) if i in axes else np.newaxis for i in range(3)
-                )
-                mask = polygon2mask(shape, vertices)[broadcast]
-                layer_data = layer_data * mask
-
-            masked_layer.data = layer_data
+            # Apply the combined mask from all shapes to the master layer in a
+            # single step. The result is written to a buffer that is reused
+            # each time the mask is updated so that we do not allocate a new
+            # volume on every call.
+            mask = self._get_roi_mask(roi_layer, layer.data.shape)
+            buffer = self._mask_buffers.get(layer)
+            if (
+                buffer is None
+                or buffer.shape != layer.data.shape
+                or buffer.dtype != layer.data.dtype
+            ):
+                buffer = np.empty_like(layer.data)
+                self._mask_buffers[layer] = buffer
+            np.multiply(layer.data, mask, out=buffer)
+            # The buffer is modified in place, so cached results computed from
+            # the masked layer can no longer be detected as stale. Note that
+            # float32 data is not copied when converting, so the buffer itself
+            # may be the float image the LoG cache compares against.
+            self._float_images.pop(masked_layer, None)
+            self._discard_log_cache(masked_layer)
+            masked_layer.data = buffer
             masked_layer.visible = True
 
     def _update_projection(self):
+        dims = self._viewer.dims
         if self._max_proj_checkbox.value:
-            self._viewer.dims.thickness = [
-                (r.stop - r.start) * 2 for r in self._viewer.dims.range
-            ]
+            margin = tuple(r.stop - r.start for r in dims.range)
+        else:
+            margin = (0,) * dims.ndim
+
+        # Setting `dims.thickness` updates the left and then the right margin,
+        # and each change re-slices every layer. Listeners read both margins
+        # when handling either event, so set the left margin silently and let
+        # the right margin trigger a single update.
+        if dims.margin_right == margin:
+            dims.margin_left = margin
         else:
-            self._viewer.dims.thickness = (0, 0, 0)
+            with dims.events.margin_left.blocker():
+                dims.margin_left = margin
+            dims.margin_right = margin
 
     def _update_dims(self, order):
         self._viewer.dims.order = order
@@ -177,12 +757,56 @@ class CtBP2Detection(Container):
         if image_layer is None:
             return
 
-        image = img_as_float(image_layer.data)
+        self._update_points(image_layer, self._find_points(image_layer))
+        for layer in self._viewer.layers:
+            if not isinstance(layer, napari.layers.Image):
+                continue
+            if layer != image_layer:
+                layer.visible = False
+
+    def _find_points(self, image_layer):
+        """
+        Detect points in the image layer using the current settings
+        """
+        image = self._float_image(image_layer)
         threshold = self._threshold_slider.value
-        points = blob_log(image, threshold=threshold, num_sigma=1)[:, :3]
+        sigma = self._sigma_spinbox.value
+        method = self._method_combo.value
+
+        halo = BLOB_DETECTORS[method](sigma)
+        region = self._search_region(image.shape, halo)
+        if region is None:
+            # ROIs do not overlap with the image.
+            return np.empty((0, image.ndim))
+
+        crop, lb, ub = region
+        if method == "LoG":
+            # Single-scale equivalent of `blob_log` with `num_sigma=1`. Peaks
+            # are cached so that only the threshold is reapplied when it
+            # changes.
+            coords, response = self._cached_log_peaks(
+                image_layer, image, crop, sigma
+            )
+            points = coords[response > threshold]
+        else:
+            points = _dog_blobs(image[crop], threshold, sigma)
+        points = points + [c.start for c in crop]
+        inside = np.all((points >= lb) & (points < ub), axis=1)
+        return points[inside]
+
+    def _update_points(self, image_layer, points):
+        """
+        Show detected points in the points layer for the image layer, creating
+        the layer if needed
+        """
         name = image_layer.name + " points"
         if name in self._viewer.layers:
-            self._viewer.layers[name].data = points
+            layer = self._viewer.layers[name]
+            # Replacing the data resizes all per-point properties and redraws
+            # the layer, so skip it if detection found the same points (e.g.,
+            # the threshold was nudged without crossing any peaks).
+            if not np.array_equal(layer.data, points):
+                layer.data = points
         else:
             layer = self._viewer.add_points(
                 points,
@@ -192,12 +816,8 @@ class CtBP2Detection(Container):
                 symbol="o",
                 out_of_slice_display=True,
             )
-
-        for layer in self._viewer.layers:
-            if not isinstance(layer, napari.layers.Image):
-                continue
-            if layer != image_layer:
-                layer.visible = False
+        # Keep a copy since points moved by hand are edited in place.
+        self._last_detection = image_layer, layer, layer.data.copy()
 
     def _mouse_click(self, layer, event):
         if layer.mode != "pan_zoom":
@@ -257,11 +877,10 @@ class CtBP2Detection(Container):
         # bounding box. Find the coordinate of the maximum intensity along this
         # and define this as the location of the new point to add to the points
         # layer.
-        ray = np.linspace(near_point, far_point, 100, endpoint=True)
-        intensities = sp.ndimage.map_coordinates(
-            image_layer.data,
-            ray.T,
-            mode="constant",
-            cval=0,
+        point = _ray_argmax(
+            np.asarray(image_layer.data),
+            np.asarray(near_point, dtype=float),
+            np.asarray(far_point, dtype=float),
+            100,
         )
-        layer.add(ray[intensities.argmax()])
+        layer.add(point)
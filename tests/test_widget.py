@@ -1,64 +1,223 @@
-# from napari_synaptogram._widget import (
-#    ExampleQWidget,
-#    ImageThreshold,
-#    threshold_autogenerate_widget,
-#    threshold_magic_widget,
-# )
-#
-#
-# def test_threshold_autogenerate_widget():
-#    # because our "widget" is a pure function, we can call it and
-#    # test it independently of napari
-#    im_data = np.random.random((100, 100))
-#    thresholded = threshold_autogenerate_widget(im_data, 0.5)
-#    assert thresholded.shape == im_data.shape
-#    # etc.
-#
-#
-## make_napari_viewer is a pytest fixture that returns a napari viewer object
-## you don't need to import it, as long as napari is installed
-## in your testing environment
-# def test_threshold_magic_widget(make_napari_viewer):
-#    viewer = make_napari_viewer()
-#    layer = viewer.add_image(np.random.random((100, 100)))
-#
-#    # our widget will be a MagicFactory or FunctionGui instance
-#    my_widget = threshold_magic_widget()
-#
-#    # if we "call" this object, it'll execute our function
-#    thresholded = my_widget(viewer.layers[0], 0.5)
-#    assert thresholded.shape == layer.data.shape
-#    # etc.
-#
-#
-# def test_image_threshold_widget(make_napari_viewer):
-#    viewer = make_napari_viewer()
-#    layer = viewer.add_image(np.random.random((100, 100)))
-#    my_widget = ImageThreshold(viewer)
-#
-#    # because we saved our widgets as attributes of the container
-#    # we can set their values without having to "interact" with the viewer
-#    my_widget._image_layer_combo.value = layer
-#    my_widget._threshold_slider.value = 0.5
-#
-#    # this allows us to run our functions directly and ensure
-#    # correct results
-#    my_widget._threshold_im()
-#    assert len(viewer.layers) == 2
-#
-#
-## capsys is a pytest fixture that captures stdout and stderr output streams
-# def test_example_q_widget(make_napari_viewer, capsys):
-#    # make viewer and add an image layer using our fixture
-#    viewer = make_napari_viewer()
-#    viewer.add_image(np.random.random((100, 100)))
-#
-#    # create our widget, passing in the viewer
-#    my_widget = ExampleQWidget(viewer)
-#
-#    # call our widget method
-#    my_widget._on_click()
-#
-#    # read captured output and check that it's as we expected
-#    captured = capsys.readouterr()
-#    assert captured.out == "napari has 1 layers\n"
+import numpy as np
+import pytest
+import scipy as sp
+from napari.components import ViewerModel
+from napari.layers import Image, Shapes
+from skimage.draw import polygon2mask
+
+from napari_synaptogram import _widget
+from napari_synaptogram._widget import (
+    DOG_SIGMA_RATIO,
+    CtBP2Detection,
+    _dog_sigmas,
+    _fft_gaussian_laplace,
+    _fill_polygon,
+    _ray_argmax_scipy,
+)
+
+
+@pytest.fixture
+def viewer():
+    return ViewerModel()
+
+
+@pytest.fixture
+def widget(qtbot, viewer):
+    widget = CtBP2Detection(viewer)
+    # The layer combos normally find the viewer through the dock widget they
+    # are added to. Point them at the viewer model directly instead.
+    widget._image_layer_combo.choices = lambda _: [
+        layer for layer in viewer.layers if isinstance(layer, Image)
+    ]
+    widget._roi_layer_combo.choices = lambda _: [
+        layer for layer in viewer.layers if isinstance(layer, Shapes)
+    ]
+    return widget
+
+
+def make_volume(shape=(20, 64, 64), n=60, seed=0):
+    rng = np.random.default_rng(seed)
+    volume = np.zeros(shape, dtype=np.float32)
+    for z, y, x in rng.integers(0, shape, (n, 3)):
+        volume[z, y, x] = 1
+    volume = sp.ndimage.gaussian_filter(volume, 1.2)
+    return volume / volume.max()
+
+
+def test_log_cache_after_remask(viewer, widget):
+    # float32 data is not copied when converted for detection, so the masked
+    # layer's buffer is itself the image the LoG cache was computed from.
+    # Editing the ROI without changing its bounding box and masking again
+    # must not reuse the stale peaks.
+    viewer.add_image(make_volume(), name="channel")
+    roi = viewer.add_shapes(
+        [np.array([[5, 5, 5], [5, 5, 60], [5, 60, 60], [5, 60, 5]])],
+        shape_type="polygon",
+    )
+    widget.reset_choices()
+    widget._roi_layer_combo.value = roi
+    widget._threshold_slider.value = 0.05
+    widget._mask()
+    widget.reset_choices()
+    widget._image_layer_combo.value = viewer.layers["channel masked"]
+    widget._detect_points()
+    points = viewer.layers["channel masked points"]
+    n_square = len(points.data)
+
+    roi.data = [np.array([[5, 5, 5], [5, 60, 60], [5, 60, 5]])]
+    widget._mask()
+    widget._detect_points()
+    n_triangle = len(points.data)
+
+    widget._log_cache = None
+    widget._detect_points()
+    assert n_triangle == len(points.data)
+    assert n_triangle < n_square
+
+
+def test_threshold_keeps_manual_points(viewer, widget):
+    viewer.add_image(make_volume(), name="channel")
+    other = viewer.add_image(make_volume(seed=1), name="other")
+    widget.reset_choices()
+    widget._image_layer_combo.value = viewer.layers["channel"]
+    widget._threshold_slider.value = 0.1
+    widget._detect_points()
+    points = viewer.layers["channel points"]
+
+    # While the layer holds the detected points, they follow the threshold.
+    n_detected = len(points.data)
+    widget._threshold_slider.value = 0.2
+    assert 0 < len(points.data) < n_detected
+
+    # Once edited by hand, the layer is left alone until detection is run.
+    points.add([10, 32, 32])
+    other.visible = True
+    expected = points.data.copy()
+    widget._threshold_slider.value = 0.1
+    np.testing.assert_array_equal(points.data, expected)
+    assert other.visible
+
+
+def test_roi_callbacks_do_not_accumulate(viewer, widget):
+    viewer.add_image(make_volume(), name="channel")
+    roi = viewer.add_shapes(
+        [np.array([[5, 5, 5], [5, 5, 60], [5, 60, 60], [5, 60, 5]])],
+        shape_type="polygon",
+    )
+    widget.reset_choices()
+    widget._roi_layer_combo.value = roi
+    widget._mask()
+    n_callbacks = len(roi.events.data.callbacks)
+    for i in range(5):
+        roi.data = [np.array([[5, 5, 5], [5, 5, 50 + i], [5, 60, 5]])]
+        widget._mask()
+    assert len(roi.events.data.callbacks) == n_callbacks
+
+    viewer.layers.remove(roi)
+    names = [
+        cb[1] for cb in roi.events.data.callbacks if isinstance(cb, tuple)
+    ]
+    assert "_clear_roi_masks" not in names
+
+
+def test_roi_mask_defaults_to_skimage(viewer, widget):
+    polygon = np.array([[5, 3.3, 4.1], [5, 20.7, 9.2], [5, 11.5, 30.6]])
+    viewer.add_image(make_volume(), name="channel")
+    roi = viewer.add_shapes([polygon], shape_type="polygon")
+    widget.reset_choices()
+    widget._roi_layer_combo.value = roi
+    mask = widget._get_roi_mask(roi, (20, 64, 64))
+    expected = polygon2mask((64, 64), polygon[:, 1:])
+    np.testing.assert_array_equal(mask[0], expected)
+
+
+@pytest.mark.parametrize(
+    "method, shape, n, sigma, threshold, lo, hi",
+    [
+        ("LoG", (20, 64, 64), 200, 1, 0.02, 20, 40),
+        ("DoG", (20, 64, 64), 200, 1, 0.02, 20, 40),
+        # The full volume is large and the crop is small. How the volume is
+        # filtered must not depend on the size of the region searched.
+        ("LoG", (256, 256, 256), 300000, 3, 0.05, 64, 128),
+    ],
+)
+def test_roi_crop_matches_full_volume(
+    viewer, widget, method, shape, n, sigma, threshold, lo, hi
+):
+    viewer.add_image(make_volume(shape, n), name="channel")
+    roi = viewer.add_shapes(
+        [np.array([[5, lo, lo], [5, lo, hi], [5, hi, hi], [5, hi, lo]])],
+        shape_type="polygon",
+    )
+    widget.reset_choices()
+    widget._roi_layer_combo.value = roi
+    widget._method_combo.value = method
+    widget._sigma_spinbox.value = sigma
+    widget._threshold_slider.value = threshold
+    widget._detect_points()
+    points = viewer.layers["channel points"]
+    cropped = points.data.copy()
+
+    roi.data = []
+    widget._detect_points()
+    full = points.data
+    inside = np.all((full[:, 1:] >= lo) & (full[:, 1:] <= hi), axis=1)
+    expected = full[inside]
+    assert len(cropped) > 0
+    np.testing.assert_array_equal(
+        np.sort(cropped, axis=0), np.sort(expected, axis=0)
+    )
+
+
+def test_dog_sigmas():
+    # Compare with the scales used internally by blob_dog.
+    sigma = 1.5
+    max_sigma, ratio = 2 * sigma, DOG_SIGMA_RATIO
+    k = int(np.mean(np.log(max_sigma / sigma) / np.log(ratio) + 1))
+    expected = [sigma * ratio**i for i in range(k + 1)]
+    np.testing.assert_allclose(_dog_sigmas(sigma), expected)
+
+
+def test_fill_polygon_matches_full_plane():
+    # Rasterizing only the bounding box must give the same mask as
+    # rasterizing the whole plane, including for polygons that extend past
+    # the edges of the plane.
+    rng = np.random.default_rng(0)
+    shape = (48, 64)
+    for _ in range(50):
+        n = rng.integers(3, 8)
+        vertices = rng.uniform(-10, 74, (n, 2))
+        mask = np.zeros(shape, dtype=bool)
+        _fill_polygon(mask, vertices)
+        np.testing.assert_array_equal(mask, polygon2mask(shape, vertices))
+
+
+@pytest.mark.skipif(_widget.numba is None, reason="numba is not installed")
+def test_ray_argmax_numba_matches_scipy():
+    volume = make_volume()
+    rng = np.random.default_rng(0)
+    # Rays start inside the volume and may leave it, where samples are zero.
+    starts = rng.uniform(0, np.array(volume.shape) - 1, (200, 3))
+    stops = starts + rng.uniform(-20, 20, (200, 3))
+    for start, stop in zip(starts, stops, strict=True):
+        expected = _ray_argmax_scipy(volume, start, stop, 50)
+        actual = _widget._ray_argmax_numba(volume, start, stop, 50)
+        # Near-ties may resolve to a different sample, so compare intensities.
+        values = sp.ndimage.map_coordinates(
+            volume, np.array([expected, actual]).T, order=1, mode="constant"
+        )
+        np.testing.assert_allclose(values[1], values[0], rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("sigma", [2.5, 3, 4])
+def test_fft_gaussian_laplace_matches_scipy(sigma):
+    rng = np.random.default_rng(0)
+    image = rng.random((24, 40, 56), dtype=np.float32)
+    image = sp.ndimage.gaussian_filter(image, 1)
+    expected = sp.ndimage.gaussian_laplace(image, sigma)
+    actual = _fft_gaussian_laplace(image, sigma)
+    assert actual.dtype == image.dtype
+    # The FFT path uses the exact Gaussian transfer function rather than a
+    # truncated, sampled kernel, so small differences are expected.
+    error = np.abs(actual - expected).max() / np.abs(expected).max()
+    assert error < 0.03